@@ -1,6 +1,11 @@
+import functools
+import itertools
+from collections.abc import Iterable, Mapping
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 from pathlib import Path
-from typing import Union
+from types import MappingProxyType
+from typing import Any, Union
 
 import epydeck
 import numpy as np
@@ -10,37 +15,96 @@ from scipy.stats import qmc
 def rundir_hierarchy(root: Path, run_num: int) -> Path:
     """Create nested directory structure for a run"""
 
-    def level_dir(exponent: int) -> Path:
-        level = 100**exponent
-        return Path(
-            f"run_{int(run_num / level) * level}_{int(run_num / level + 1) * level}"
-        )
-
-    level_1_dir = level_dir(3)
-    level_2_dir = level_dir(2)
-    level_3_dir = level_dir(1)
-    level_4_dir = f"run_{run_num}"
-
-    path = root / level_1_dir / level_2_dir / level_3_dir / level_4_dir
+    lo1 = (run_num // 1_000_000) * 1_000_000
+    lo2 = (run_num // 10_000) * 10_000
+    lo3 = (run_num // 100) * 100
+
+    path = (
+        root
+        / f"run_{lo1}_{lo1 + 1_000_000}"
+        / f"run_{lo2}_{lo2 + 10_000}"
+        / f"run_{lo3}_{lo3 + 100}"
+        / f"run_{run_num}"
+    )
     path.mkdir(parents=True, exist_ok=True)
     return path
 
 
-def _expand_flatkey(flat_key: str, value) -> dict:
-    key_parts = flat_key.split(":", maxsplit=1)
-    if len(key_parts) > 1:
-        value = _expand_flatkey(key_parts[1], value)
-    return {key_parts[0]: value}
+def _cartesian_indices_numpy(shape: tuple[int, ...], start: int, stop: int):
+    return np.stack(np.unravel_index(np.arange(start, stop), shape), axis=-1)
 
 
-def expand_flatdict(flat_dict: dict) -> dict:
+def _cartesian_indices_loop(shape, start: int, stop: int):
+    # Plain loop for numba to compile, see `_cartesian_indices_numba`
+    indices = np.empty((stop - start, len(shape)), dtype=np.int64)
+    for n in range(stop - start):
+        flat = start + n
+        for k in range(len(shape) - 1, -1, -1):
+            indices[n, k] = flat % shape[k]
+            flat //= shape[k]
+    return indices
+
+
+@functools.lru_cache(maxsize=1)
+def _cartesian_indices_numba():
+    """Compiled `_cartesian_indices_loop`, or `None` if `numba` isn't
+    installed. `numba` is only imported the first time this is called,
+    so it doesn't slow down importing `epyscan`
+    """
+    try:
+        from numba import njit  # noqa: PLC0415
+    except ImportError:
+        return None
+    return njit(cache=True)(_cartesian_indices_loop)
+
+
+def _cartesian_indices(shape: tuple[int, ...], start: int, stop: int) -> np.ndarray:
+    """Grid indices of flat samples ``[start, stop)`` as an ``(N, K)`` array
+
+    Uses a compiled loop when `numba` is installed and both the window
+    and the number of parameters are large enough for it to beat
+    `np.unravel_index`, including the one-off cost of compiling it
+    """
+    if len(shape) >= 4 and stop - start >= 100_000:
+        kernel = _cartesian_indices_numba()
+        if kernel is not None:
+            return kernel(np.asarray(shape, dtype=np.int64), start, stop)
+    return _cartesian_indices_numpy(shape, start, stop)
+
+
+def _expand_rows(rows: Iterable[tuple[tuple[str, ...], Any]]) -> dict:
+    """Build nested dict from ``(key_path, value)`` pairs"""
     result = {}
-    for key, value in flat_dict.items():
-        result = epydeck.deep_update(result, _expand_flatkey(key, value))
+    for (*parents, leaf), value in rows:
+        block = result
+        for part in parents:
+            block = block.setdefault(part, {})
+        block[leaf] = value
 
     return result
 
 
+@functools.lru_cache(maxsize=1024)
+def _split_flatkey(flat_key: str) -> tuple[str, ...]:
+    # Samples reuse the same few keys, so only split each one once
+    return tuple(flat_key.split(":"))
+
+
+def expand_flatdict(flat_dict: dict) -> dict:
+    return _expand_rows(
+        (_split_flatkey(flat_key), value) for flat_key, value in flat_dict.items()
+    )
+
+
+def _read_only(value):
+    """Recursive read-only view of nested dicts and lists"""
+    if isinstance(value, dict):
+        return MappingProxyType({k: _read_only(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_read_only(v) for v in value)
+    return value
+
+
 class Campaign:
     """Campaign of runs based on a template dict
 
@@ -49,7 +113,10 @@ class Campaign:
     Arguments
     ---------
     template:
-        Base template deck as a Python dict (for example, as created by `epydeck`)
+        Base template deck as a Python dict (for example, as created by
+        `epydeck`). The template is copied and each block rendered
+        once. `Campaign.template` is a read-only view of it, so to
+        change the template, assign a new dict to `Campaign.template`
     root:
         Path to root run directory
 
@@ -68,6 +135,19 @@ class Campaign:
         self.template = template
         self.root = Path(root)
 
+    @property
+    def template(self) -> Mapping:
+        """Read-only view of the base template deck"""
+        return self._template_view
+
+    @template.setter
+    def template(self, template: dict):
+        self._template = deepcopy(template)
+        self._template_view = _read_only(self._template)
+        self._rendered_blocks = {
+            name: epydeck.dumps({name: block}) for name, block in self._template.items()
+        }
+
     def setup_case(self, sample: dict):
         """Create run directory with input deck for given sample
 
@@ -79,16 +159,87 @@ class Campaign:
 
         """
 
-        expanded_sample_dict = expand_flatdict(sample)
-        full_sample = epydeck.deep_update(self.template, expanded_sample_dict)
-        path = rundir_hierarchy(self.root, self._counter)
+        return self.setup_case_parsed(
+            (_split_flatkey(flat_key), value) for flat_key, value in sample.items()
+        )
+
+    def setup_case_parsed(self, rows: Iterable[tuple[tuple[str, ...], Any]]) -> Path:
+        """Create run directory with input deck for given sample, as
+        ``(key_path, value)`` pairs with the keys already split into
+        blocks
 
-        with (path / "input.deck").open("w") as f:
-            epydeck.dump(full_sample, f)
+        Parameters
+        ----------
+        rows : Iterable[tuple[tuple[str, ...], Any]]
+            Pairs of key paths, such as ``("block", "parameter")``,
+            and values to apply to base template
+
+        Examples
+        --------
+        >>> paths = [campaign.setup_case_parsed(row) for row in grid_scan.rows()]
+
+        """
 
+        path = self._write_case(self._counter, _expand_rows(rows))
         self._counter += 1
         return path
 
+    def setup_cases(self, samples: Iterable[dict], max_workers: int = 8) -> list[Path]:
+        """Create run directories with input decks for several samples
+
+        Cases are written concurrently, but are numbered and returned
+        in the same order as ``samples``. Samples are consumed in
+        small batches, so ``samples`` can be a lazy iterable of any
+        size
+
+        Parameters
+        ----------
+        samples : Iterable[dict]
+            Dicts of specific parameter values to apply to base
+            template
+        max_workers : int
+            Maximum number of threads used to write cases
+
+        Examples
+        --------
+        >>> paths = campaign.setup_cases(grid_scan)
+
+        """
+
+        samples = iter(samples)
+        batch_size = 4 * max_workers
+        paths = []
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while batch := list(itertools.islice(samples, batch_size)):
+                indices = range(self._counter, self._counter + len(batch))
+                self._counter += len(batch)
+                paths.extend(executor.map(self._setup_case_at, indices, batch))
+
+        return paths
+
+    def _setup_case_at(self, index: int, sample: dict) -> Path:
+        return self._write_case(index, expand_flatdict(sample))
+
+    def _write_case(self, index: int, expanded_sample_dict: dict) -> Path:
+        full_sample = epydeck.deep_update(self._template, expanded_sample_dict)
+
+        # Only blocks changed by the sample need rendering again. The
+        # whole deck is built in memory so it's written in one go
+        deck = "".join(
+            (
+                epydeck.dumps({name: block})
+                if name in expanded_sample_dict
+                else self._rendered_blocks[name]
+            )
+            for name, block in full_sample.items()
+        )
+
+        path = rundir_hierarchy(self.root, index)
+        (path / "input.deck").write_text(deck)
+
+        return path
+
 
 class GridScan:
     """Uniform sampling of the Cartesian outer product of the parameter ranges
@@ -124,6 +275,12 @@ class GridScan:
 
         def _gridspace(start, stop, num: int, log=False):
             """Generalisation over logspace/linspace"""
+            # Degenerate axes don't need any interpolation (or logs)
+            if num == 1:
+                return np.array([start], dtype=float)
+            if start == stop:
+                return np.full(num, start, dtype=float)
+
             if log:
                 return np.logspace(np.log10(start), np.log10(stop), num=num)
 
@@ -134,56 +291,193 @@ class GridScan:
             for k, v in parameters.items()
         }
 
-        grids = np.meshgrid(*self.parameters.values(), indexing="ij")
-
-        self._samples = [
-            dict(zip(parameters.keys(), sample))
-            for sample in zip(*(grid.flat for grid in grids))
-        ]
+        self._keys = tuple(parameters.keys())
+        self._paths = tuple(tuple(key.split(":")) for key in self._keys)
+        self._axes = [np.asarray(v) for v in self.parameters.values()]
+        # Native Python scalars are cheaper to build dicts from and dump
+        self._axes_lists = [axis.tolist() for axis in self._axes]
+        self._shape = tuple(len(axis) for axis in self._axes)
+        # No parameters means an empty scan, not a single empty sample
+        self._n_samples = int(np.prod(self._shape)) if self._shape else 0
+        self._offset = 0
 
-        self._n_samples = len(self._samples)
-        self._sample_iter = iter(self._samples)
+    def _sample_at(self, index: tuple[int, ...]) -> dict:
+        return {k: axis[i] for k, axis, i in zip(self._keys, self._axes_lists, index)}
 
     def __len__(self) -> int:
         return self._n_samples
 
+    def _generate(self):
+        # `product` varies the last axis fastest, matching the
+        # `meshgrid(..., indexing="ij")` flattened order
+        if self._n_samples == 0:
+            return
+        for values in itertools.product(*self._axes_lists):
+            yield dict(zip(self._keys, values))
+
     def __iter__(self):
-        return self._sample_iter
+        """Iterate over all samples, starting from the first each time"""
+        return self._generate()
+
+    def rows(self):
+        """Iterate over all samples as lists of ``(key_path, value)``
+        pairs, with the keys already split into blocks"""
+        if self._n_samples == 0:
+            return
+        for values in itertools.product(*self._axes_lists):
+            yield list(zip(self._paths, values))
 
     def __next__(self):
-        return next(self._sample_iter)
+        if self._offset >= self._n_samples:
+            raise StopIteration
+        sample = self[self._offset]
+        self._offset += 1
+        return sample
+
+    def __getitem__(self, i: int) -> dict:
+        if i < 0:
+            i += self._n_samples
+        if not 0 <= i < self._n_samples:
+            raise IndexError("GridScan index out of range")
+        return self._sample_at(np.unravel_index(i, self._shape))
 
     def sample(self, num: int = 1) -> list[dict]:
-        return [sample for (sample, _) in zip(self, range(num))]
+        """Return the next ``num`` samples, or as many as remain"""
+        stop = max(self._offset, min(self._offset + num, self._n_samples))
+        if stop == self._offset:
+            return []
+        indices = _cartesian_indices(self._shape, self._offset, stop)
+        self._offset = stop
+
+        # Gather the whole window in NumPy, then convert to native
+        # Python scalars in a single pass
+        values = np.column_stack(
+            [axis[indices[:, i]] for i, axis in enumerate(self._axes)]
+        ).tolist()
+        return [dict(zip(self._keys, row)) for row in values]
+
+
+_QMC_ENGINES = {
+    "sobol": qmc.Sobol,
+    "halton": qmc.Halton,
+    "lhs": qmc.LatinHypercube,
+}
+
+
+class QMCSampler:
+    """Quasi-Monte Carlo sampling of the parameter ranges
+
+    Low-discrepancy sequences fill the parameter space more evenly
+    than random sampling. For smooth responses, scrambled Sobol'
+    sequences typically converge faster than Latin hypercube
+    sampling, so fewer (expensive) runs are needed for the same
+    accuracy. Sobol' sequences are only balanced when the number of
+    samples is a power of two, so prefer `random_base2` with them.
+    Halton sequences don't have this restriction, but degrade in
+    high dimensions.
 
+    Arguments
+    ---------
+    parameters:
+        Mapping of parameters to ranges, in the same form as for
+        `GridScan`
+    qmc_type:
+        Low-discrepancy sequence to use, one of `"sobol"`, `"halton"`,
+        or `"lhs"` (Latin hypercube)
+    **engine_options:
+        Passed on to the `scipy.stats.qmc` engine
 
-class LatinHypercubeSampler:
-    def __init__(self, parameters: dict):
-        self._parameters = deepcopy(parameters)
-        for key, value in self._parameters.items():
-            if value.get("log", False):
-                self._parameters[key] = {
-                    "min": np.log(value["min"]),
-                    "max": np.log(value["max"]),
-                    "log": True,
-                }
+    Examples
+    --------
+    >>> parameters = {
+          "block:var1": {"min": 1.0e1, "max": 1.0e4, "log": True},
+          "block:var2": {"min": 2.0, "max": 5.0},
+        }
+    >>> sampler = QMCSampler(parameters, qmc_type="sobol")
+    >>> samples = sampler.random_base2(m=4)
 
-        self._sampler = qmc.LatinHypercube(d=len(parameters.keys()))
+    """
 
-        self._l_bounds = [param["min"] for param in self._parameters.values()]
-        self._u_bounds = [param["max"] for param in self._parameters.values()]
+    def __init__(self, parameters: dict, qmc_type: str = "sobol", **engine_options):
+        if qmc_type not in _QMC_ENGINES:
+            raise ValueError(
+                f"Unknown qmc_type '{qmc_type}', expected one of {list(_QMC_ENGINES)}"
+            )
+
+        num_params = len(parameters)
+        self._keys = tuple(parameters.keys())
+        self._l_bounds = np.empty(num_params)
+        self._u_bounds = np.empty(num_params)
+        self._log_mask = np.zeros(num_params, dtype=bool)
+
+        for i, value in enumerate(parameters.values()):
+            self._l_bounds[i] = value["min"]
+            self._u_bounds[i] = value["max"]
+            self._log_mask[i] = value.get("log", False)
+
+        self._l_bounds[self._log_mask] = np.log(self._l_bounds[self._log_mask])
+        self._u_bounds[self._log_mask] = np.log(self._u_bounds[self._log_mask])
+
+        self.qmc_type = qmc_type
+        self._sampler = _QMC_ENGINES[qmc_type](d=num_params, **engine_options)
 
     def __next__(self):
         return self.sample()[0]
 
-    def sample(self, num: int = 1):
-        samples = self._sampler.random(num)
+    def _scale(self, samples: np.ndarray) -> list[dict]:
         scaled = qmc.scale(samples, self._l_bounds, self._u_bounds)
+        scaled[:, self._log_mask] = np.exp(scaled[:, self._log_mask])
+
+        return [dict(zip(self._keys, row.tolist())) for row in scaled]
+
+    def sample(self, num: int = 1) -> list[dict]:
+        return self._scale(self._sampler.random(num))
+
+    def random_base2(self, m: int) -> list[dict]:
+        """Draw ``2**m`` samples, preserving the balance properties of
+        Sobol' sequences
+
+        Only available when ``qmc_type="sobol"``
+        """
+        if self.qmc_type != "sobol":
+            raise ValueError(
+                f"random_base2 requires qmc_type='sobol', not '{self.qmc_type}'"
+            )
+        return self._scale(self._sampler.random_base2(m))
+
 
-        results = [dict(zip(self._parameters.keys(), sample)) for sample in scaled]
-        for result in results:
-            for key, value in result.items():
-                if self._parameters[key].get("log", False):
-                    result[key] = np.exp(value)
+class LatinHypercubeSampler(QMCSampler):
+    """Latin hypercube sampling of the parameter ranges
 
-        return results
+    Arguments
+    ---------
+    parameters:
+        Mapping of parameters to ranges, in the same form as for
+        `GridScan`
+    strength:
+        Strength of the orthogonal array: 1 for plain LHS, or 2 for
+        orthogonal array-based LHS. Strength 2 needs the number of
+        samples to be the square of a prime ``p``, with at most
+        ``p + 1`` parameters
+    optimization:
+        (optional) Optimisation scheme to improve the space filling,
+        either `"random-cd"` or `"lloyd"`. These give better
+        samples, but are much slower to draw, so are off by default.
+        Optimising rearranges the samples, which can break the
+        orthogonal array structure, so don't rely on the strength 2
+        guarantees when using it
+
+    """
+
+    def __init__(
+        self,
+        parameters: dict,
+        strength: int = 1,
+        optimization=None,
+    ):
+        super().__init__(
+            parameters,
+            qmc_type="lhs",
+            strength=strength,
+            optimization=optimization,
+        )
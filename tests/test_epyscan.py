@@ -1,4 +1,9 @@
+import subprocess
+import sys
+
 import epydeck
+import numpy as np
+import pytest
 
 import epyscan
 
@@ -64,6 +69,94 @@ def test_gridscan():
     ]
 
     assert samples == expected
+    assert all(type(value) is float for sample in samples for value in sample.values())
+
+
+def test_gridscan_degenerate_axes():
+    parameters = {
+        "block:var1": {"min": 1.0e1, "max": 1.0e1, "log": True},
+        "block:var2": {"min": 2.0, "max": 5.0},
+    }
+
+    grid_scan = epyscan.GridScan(parameters, n_samples=2)
+    assert list(grid_scan) == [
+        {"block:var1": 1.0e1, "block:var2": 2.0},
+        {"block:var1": 1.0e1, "block:var2": 5.0},
+        {"block:var1": 1.0e1, "block:var2": 2.0},
+        {"block:var1": 1.0e1, "block:var2": 5.0},
+    ]
+
+    grid_scan = epyscan.GridScan(parameters, n_samples=1)
+    assert list(grid_scan) == [{"block:var1": 1.0e1, "block:var2": 2.0}]
+
+
+def test_gridscan_no_parameters():
+    grid_scan = epyscan.GridScan({})
+
+    assert len(grid_scan) == 0
+    assert list(grid_scan) == []
+    assert list(grid_scan.rows()) == []
+    assert grid_scan.sample(3) == []
+    with pytest.raises(StopIteration):
+        next(grid_scan)
+    with pytest.raises(IndexError):
+        grid_scan[0]
+
+
+def test_gridscan_getitem():
+    parameters = {
+        "block:var1": {"min": 1.0e1, "max": 1.0e4, "log": True},
+        "block:var2": {"min": 2.0, "max": 5.0},
+    }
+
+    grid_scan = epyscan.GridScan(parameters, n_samples=4)
+
+    assert len(grid_scan) == 16
+    assert grid_scan[0] == {"block:var1": 1.0e1, "block:var2": 2.0}
+    assert grid_scan[6] == {"block:var1": 1.0e2, "block:var2": 4.0}
+    assert grid_scan[-1] == {"block:var1": 1.0e4, "block:var2": 5.0}
+    assert [grid_scan[i] for i in range(len(grid_scan))] == list(grid_scan)
+
+
+def test_gridscan_reiterate():
+    parameters = {
+        "block:var1": {"min": 1.0e1, "max": 1.0e4, "log": True},
+        "block:var2": {"min": 2.0, "max": 5.0},
+    }
+
+    grid_scan = epyscan.GridScan(parameters, n_samples=4)
+
+    assert list(grid_scan) == list(grid_scan)
+    assert next(grid_scan) == grid_scan[0]
+    assert grid_scan.sample(2) == [grid_scan[1], grid_scan[2]]
+    assert grid_scan.sample(-1) == []
+    assert grid_scan.sample(20) == [grid_scan[i] for i in range(3, 16)]
+    assert len(list(grid_scan)) == 16
+
+
+def test_gridscan_sample_many_parameters():
+    parameters = {f"block:var{i}": {"min": 1.0, "max": i + 2.0} for i in range(5)}
+
+    grid_scan = epyscan.GridScan(parameters, n_samples=3)
+    samples = grid_scan.sample(100) + grid_scan.sample(1000)
+
+    assert samples == list(grid_scan)
+    assert len(samples) == 3**5
+
+
+def test_cartesian_indices_numba():
+    pytest.importorskip("numba")
+
+    shape = (3, 4, 5, 6, 7)
+    np.testing.assert_array_equal(
+        epyscan._cartesian_indices_numba()(np.asarray(shape), 10, 2000),
+        epyscan._cartesian_indices_numpy(shape, 10, 2000),
+    )
+
+
+def test_import_does_not_import_numba():
+    code = "import sys, epyscan; assert 'numba' not in sys.modules"
+    subprocess.run([sys.executable, "-c", code], check=True)
 
 
 def test_campaign(tmp_path):
@@ -110,3 +203,174 @@ def test_campaign(tmp_path):
         actual_case_deck = epydeck.load(f)
 
     assert actual_case_deck == expected_case_deck
+
+
+def test_latin_hypercube_sampler():
+    parameters = {
+        "block:var1": {"min": 1.0e1, "max": 1.0e4, "log": True},
+        "block:var2": {"min": 2.0, "max": 5.0},
+    }
+
+    sampler = epyscan.LatinHypercubeSampler(parameters)
+    samples = sampler.sample(20)
+
+    assert len(samples) == 20
+    for sample in samples:
+        assert sample.keys() == parameters.keys()
+        assert 1.0e1 <= sample["block:var1"] <= 1.0e4
+        assert 2.0 <= sample["block:var2"] <= 5.0
+
+
+def test_latin_hypercube_sampler_strength():
+    parameters = {
+        "block:var1": {"min": 1.0e1, "max": 1.0e4, "log": True},
+        "block:var2": {"min": 2.0, "max": 5.0},
+    }
+
+    sampler = epyscan.LatinHypercubeSampler(parameters, strength=2)
+    samples = sampler.sample(9)
+
+    # Strength 2 puts one sample in each cell of a 3x3 grid over the
+    # (log-scaled) unit square
+    unit = np.array(
+        [
+            [np.log10(s["block:var1"] / 1.0e1) / 3, (s["block:var2"] - 2.0) / 3]
+            for s in samples
+        ]
+    )
+    cells = {tuple(cell) for cell in np.minimum(3 * unit, 2).astype(int)}
+    assert len(cells) == 9
+
+    assert len(epyscan.LatinHypercubeSampler(parameters).sample(1)) == 1
+
+
+def test_latin_hypercube_sampler_optimization():
+    parameters = {
+        "block:var1": {"min": 1.0e1, "max": 1.0e4, "log": True},
+        "block:var2": {"min": 2.0, "max": 5.0},
+    }
+
+    sampler = epyscan.LatinHypercubeSampler(parameters, optimization="random-cd")
+    samples = sampler.sample(10)
+
+    assert len(samples) == 10
+    for sample in samples:
+        assert 1.0e1 <= sample["block:var1"] <= 1.0e4
+        assert 2.0 <= sample["block:var2"] <= 5.0
+
+
+def test_campaign_template_changes(tmp_path):
+    template = {"block": {"a": 1, "b": [2, 3]}, "other_block": {"c": 3}}
+    campaign = epyscan.Campaign(template, tmp_path)
+
+    # In-place edits of the campaign's template are rejected
+    with pytest.raises(TypeError):
+        campaign.template["other_block"]["c"] = 5
+    with pytest.raises(AttributeError):
+        campaign.template["block"]["b"].append(4)
+
+    # and edits to the original dict don't affect the campaign
+    template["other_block"]["c"] = 4
+    path = campaign.setup_case({"block:a": 10})
+
+    with (path / "input.deck").open() as f:
+        assert epydeck.load(f) == {
+            "block": {"a": 10, "b": [2, 3]},
+            "other_block": {"c": 3},
+        }
+
+    campaign.template = {"block": {"a": 1, "b": 20}, "new": {"d": 6}}
+    path = campaign.setup_case({"block:a": 10})
+
+    with (path / "input.deck").open() as f:
+        assert epydeck.load(f) == {"block": {"a": 10, "b": 20}, "new": {"d": 6}}
+
+
+def test_campaign_setup_cases(tmp_path):
+    parameters = {
+        "block:var1": {"min": 1.0e1, "max": 1.0e4, "log": True},
+        "block:var2": {"min": 2.0, "max": 5.0},
+    }
+
+    grid_scan = epyscan.GridScan(parameters, n_samples=4)
+    template = {"block": {"var3": 1.23}, "other_block": {"var4": True}}
+    campaign = epyscan.Campaign(template, tmp_path)
+
+    first_path = campaign.setup_case(grid_scan[0])
+    # A generator and a small pool, so the samples span several batches
+    paths = campaign.setup_cases(iter(grid_scan), max_workers=2)
+
+    base_path = tmp_path / "run_0_1000000/run_0_10000/run_0_100"
+
+    assert first_path == base_path / "run_0"
+    assert paths == [base_path / f"run_{i}" for i in range(1, 17)]
+
+    assert campaign.setup_case(grid_scan[0]) == base_path / "run_17"
+
+    for path, sample in zip(paths, grid_scan):
+        with (path / "input.deck").open() as f:
+            actual_case_deck = epydeck.load(f)
+
+        assert actual_case_deck["block"]["var1"] == sample["block:var1"]
+        assert actual_case_deck["block"]["var2"] == sample["block:var2"]
+        assert actual_case_deck["block"]["var3"] == 1.23
+
+
+@pytest.mark.parametrize("qmc_type", ["sobol", "halton", "lhs"])
+def test_qmc_sampler(qmc_type):
+    parameters = {
+        "block:var1": {"min": 1.0e1, "max": 1.0e4, "log": True},
+        "block:var2": {"min": 2.0, "max": 5.0},
+    }
+
+    sampler = epyscan.QMCSampler(parameters, qmc_type=qmc_type)
+    samples = sampler.sample(16)
+
+    assert len(samples) == 16
+    for sample in samples:
+        assert sample.keys() == parameters.keys()
+        assert 1.0e1 <= sample["block:var1"] <= 1.0e4
+        assert 2.0 <= sample["block:var2"] <= 5.0
+
+
+def test_qmc_sampler_random_base2():
+    parameters = {
+        "block:var1": {"min": 1.0e1, "max": 1.0e4, "log": True},
+        "block:var2": {"min": 2.0, "max": 5.0},
+    }
+
+    assert len(epyscan.QMCSampler(parameters).random_base2(m=3)) == 8
+
+    with pytest.raises(ValueError, match="random_base2"):
+        epyscan.QMCSampler(parameters, qmc_type="halton").random_base2(m=3)
+
+
+def test_qmc_sampler_unknown_type():
+    with pytest.raises(ValueError, match="Unknown qmc_type"):
+        epyscan.QMCSampler({"block:var1": {"min": 0, "max": 1}}, qmc_type="foo")
+
+
+def test_campaign_setup_case_parsed(tmp_path):
+    parameters = {
+        "block:var1": {"min": 1.0e1, "max": 1.0e4, "log": True},
+        "block:var2": {"min": 2.0, "max": 5.0},
+    }
+
+    grid_scan = epyscan.GridScan(parameters, n_samples=4)
+    rows = list(grid_scan.rows())
+
+    assert rows[4] == [(("block", "var1"), 1.0e2), (("block", "var2"), 2.0)]
+
+    template = {"block": {"var3": 1.23}, "other_block": {"var4": True}}
+    campaign = epyscan.Campaign(template, tmp_path)
+    paths = [campaign.setup_case_parsed(row) for row in rows]
+
+    assert paths[4] == tmp_path / "run_0_1000000/run_0_10000/run_0_100/run_4"
+
+    with (paths[4] / "input.deck").open() as f:
+        actual_case_deck = epydeck.load(f)
+
+    assert actual_case_deck == {
+        "block": {"var1": 1e2, "var2": 2.0, "var3": 1.23},
+        "other_block": {"var4": True},
+    }